@@ -0,0 +1,20 @@
+from math import exp
+
+from numba import njit, prange
+
+# No fastmath: unsmoothed log probabilities may be -inf
+@njit(parallel=True, cache=True)
+def score_indexed(indptr, indices, log_p_ham, log_p_spam, log_prior_ham, log_prior_spam, out):
+    """Write the class probabilities of messages indexed by `index_messages` in `out`"""
+    for i in prange(indptr.size - 1):
+        s_ham = log_prior_ham
+        s_spam = log_prior_spam
+        for k in range(indptr[i], indptr[i + 1]):
+            j = indices[k]
+            s_ham += log_p_ham[j]
+            s_spam += log_p_spam[j]
+        m = max(s_ham, s_spam)
+        e_ham = exp(s_ham - m)
+        e_spam = exp(s_spam - m)
+        out[i, 0] = e_ham / (e_ham + e_spam)
+        out[i, 1] = e_spam / (e_ham + e_spam)
@@ -1,9 +1,29 @@
+from functools import lru_cache
+
+import numpy as np
+
 from . import preprocessing as pp
 
+# Batches smaller than this are scored message by message, building the sparse
+# indicator matrix costs more than it saves on a handful of messages
+_MIN_SPARSE_BATCH_SIZE = 8
+
+# Without smoothing, a message with words seen in only one class each has a zero
+# likelihood for both classes
+_ZERO_LIKELIHOOD_ERROR = (
+    "The message has a zero probability for both classes because it contains words "
+    "never seen in ham and words never seen in spam messages; use a smoothing alpha > 0."
+)
+
 class SpamDetector:
     def __init__(self, alpha=1.0):
         self.alpha = alpha
-        self._word_counts = None
+        self.vocab = None
+        self.word_to_idx = None
+        self.n_ham_arr = None
+        self.n_spam_arr = None
+        self.log_odds = None
+        self.log_prior_odds = None
         self.n_train_messages = None
         self.n_ham = None
         self.n_spam = None
@@ -21,14 +41,64 @@ class SpamDetector:
         self: SpamDetector
             The fitted model
         """
+        return self.fit_counts(messages, classes).set_alpha(self.alpha)
+    def fit_counts(self, messages, classes):
+        """Count the words of the train corpus
+        This is the expensive part of `fit`. The model can only be used for predictions
+        once the probabilities are estimated with `set_alpha`.
+        Parameters
+        ----------
+        messages: seq of str
+            The train messages
+        classes: seq of str
+            The train classes
+        Returns
+        -------
+        self: SpamDetector
+            The model with its word counts
+        """
         ann_msg = list(zip(classes, messages))  # Convert to list to be able to use `len`
         self.n_train_messages = len(ann_msg)
-        self._word_counts = pp.count_words_in_ham_and_spam(ann_msg)
+        word_counts = pp.count_words_in_ham_and_spam(ann_msg)
+        self.vocab = list(word_counts)
+        self.word_to_idx = {w: i for i, w in enumerate(self.vocab)}
+        self.n_ham_arr = np.fromiter(
+            (n for n, _ in word_counts.values()), dtype=np.int32, count=len(self.vocab)
+        )
+        self.n_spam_arr = np.fromiter(
+            (n for _, n in word_counts.values()), dtype=np.int32, count=len(self.vocab)
+        )
         self.n_ham, self.n_spam = pp.count_ham_and_spam(ann_msg)
-        self._prob_info = estimate_probabilities(
-            self._word_counts, (self.n_ham, self.n_spam), alpha=self.alpha
+        self._prob_info = None  # Estimated on the new counts by `set_alpha`
+        self.log_odds = None
+        self.log_prior_odds = None
+        return self
+    def set_alpha(self, alpha):
+        """Set the smoothing parameter and estimate the probabilities
+        The word counts computed by `fit` or `fit_counts` are reused, so trying
+        several values of `alpha` only tokenizes the train corpus once.
+        Parameters
+        ----------
+        alpha: float
+            The additive smoothing parameter.
+        Returns
+        -------
+        self: SpamDetector
+            The fitted model
+        """
+        self.alpha = alpha
+        log_p_ham, log_p_spam, log_prior_ham, log_prior_spam = estimate_probabilities(
+            (self.n_ham_arr, self.n_spam_arr), (self.n_ham, self.n_spam), alpha=self.alpha
         )
+        self._prob_info = (log_p_ham, log_p_spam, self.word_to_idx, log_prior_ham, log_prior_spam)
+        self.log_odds = log_p_ham - log_p_spam
+        self.log_prior_odds = log_prior_ham - log_prior_spam
         return self
+    def _check_probabilities(self):
+        if self._prob_info is None:
+            raise ValueError(
+                "The probabilities are not estimated, call `fit`, or `set_alpha` after `fit_counts`."
+            )
     def predict_proba(self, messages):
         """Compute the predicted class probability
         Parameters
@@ -41,10 +111,42 @@ class SpamDetector:
             For a single message it returns a tuple `(p_ham, p_spam)` for the message.
             It returns a list of such tuples if the input is a sequence of messages.
         """
+        self._check_probabilities()
         if isinstance(messages, str):  # Single message
             return classify_message(messages, self._prob_info)
         else:
-            return [classify_message(msg, self._prob_info) for msg in messages]
+            messages = list(messages)
+            if len(messages) < _MIN_SPARSE_BATCH_SIZE:
+                return [classify_message(msg, self._prob_info) for msg in messages]
+            return classify_messages(messages, self._prob_info)
+    def predict_proba_batch(self, messages):
+        """Compute the predicted class probability of a large batch of messages
+        Messages are scored by a parallel compiled kernel when `numba` is installed
+        and by a sparse matrix product otherwise.
+        Parameters
+        ----------
+        messages: seq of str
+            A sequence of messages
+        Returns
+        -------
+        proba: np.ndarray
+            An array of shape `(len(messages), 2)` with the `(p_ham, p_spam)` probabilities
+            of each message.
+        """
+        self._check_probabilities()
+        log_p_ham, log_p_spam, word_to_idx, log_prior_ham, log_prior_spam = self._prob_info
+        indptr, indices = pp.index_messages(messages, word_to_idx)
+        score_indexed = _score_kernel()
+        if score_indexed is None:
+            return _classify_indexed(indptr, indices, self._prob_info)
+        proba = np.empty((len(indptr) - 1, 2), dtype=np.float64)
+        score_indexed(
+            indptr, indices, log_p_ham, log_p_spam,
+            float(log_prior_ham), float(log_prior_spam), proba
+        )
+        if np.isnan(proba).any():  # The kernel gives nan for zero likelihoods
+            raise ValueError(_ZERO_LIKELIHOOD_ERROR)
+        return proba
     def predict(self, messages):
         """Compute the predicted class probability
         Parameters
@@ -57,97 +159,176 @@ class SpamDetector:
             For a single message it returns the predicted class has a "ham" or "spam" string
             for the input message.
             It returns a list of predicted classes if the input is a sequence of messages.
+        Note
+        ----
+        A message is predicted as ham when its log-odds `log(p_ham / p_spam)` is positive,
+        which is equivalent to `p_ham > 0.5` without computing the probabilities.
         """
-        probs = self.predict_proba(messages)
+        self._check_probabilities()
         if isinstance(messages, str):  # single message
-            return "ham" if probs[0] > 0.5 else "spam"
+            _, indices = pp.index_messages([messages], self.word_to_idx)
+            with np.errstate(invalid="ignore"):  # inf - inf log-odds give nan
+                score = self.log_odds[indices].sum() + self.log_prior_odds
+            if np.isnan(score):
+                raise ValueError(_ZERO_LIKELIHOOD_ERROR)
+            return "ham" if score > 0 else "spam"
         else:
-            return [
-                "ham" if p[0] > 0.5 else "spam"
-                for p in probs
-            ]
-
-    def estimate_probabilities(word_counts, n_classes, alpha=0.0):
-        """Estimate p(w|c) and p(c)
-        Estimate conditional probability of words knowing the class
-        as well as marginal probabilities based on frequencies.
-        Parameters
-        ----------
-        word_counts: dict
-            Dictionary of word counts provided as `(word, (n_w_ham, n_w_spam))` items.
-        alpha: float, optional (default=0.0)
-            The additive smoothing parameter.
-        Returns
-        -------
-        prob_word_knowing_class:dict
-            Probability of word knowing the class provided as `(word, (p_w_ham, p_w_spam))` items.
-        prob_class: tuple
-            Probability of class provided as a `(p_ham, p_spam)` tuple
-        """
-        n_ham, n_spam = n_classes
-        n_tot = n_ham + n_spam + 2 * alpha
-        if alpha > 0:
-            n_ham += alpha
-            n_spam += alpha
-        p_ham = n_ham / n_tot
-        p_spam = n_spam / n_tot
-        p_class = (p_ham, p_spam)
-        p_word_knowing_class = {}
-        for word, (n_word_ham, n_word_spam) in word_counts.items():
-            p_word_ham = (n_word_ham + alpha) / n_ham
-            p_word_spam = (n_word_spam + alpha) / n_spam
-            p_word_knowing_class[word] = (p_word_ham, p_word_spam)
-        return p_word_knowing_class, p_class
-
-    def classify_message(message, prob_info):
-        """Compute the probability for a message to be ham or spam
-        Parameters
-        ----------
-        message: str
-            The input message.
-        prob_info: tuple
-            A tuple containing probability information computed on the training corpus as
-            output by the `estimate_prob_word_knowing_class` function.
-            It contains:
-            p_word_knowing_class: dict
-                The probability of a message to contain a given word knowing its class.
-            p_class: tuple
-                The probability of the class as a (p_ham, p_spam) tuple.
-        Returns
-        -------
-        p_ham: float
-            The probability of the message to belong to the ham class
-        p_spam: float
-            The probability of the message to belong to the spam class.
-        """
-        p_word_class, p_class = prob_info
-        msg_words = pp.split_words(pp.clean_msg(message))
-        p_msg_ham = 1.0
-        p_msg_spam = 1.0
-        for word in msg_words:
-            p_word_ham, p_word_spam = p_word_class.get(word, (1.0, 1.0))
-            p_msg_ham *= p_word_ham
-            p_msg_spam *= p_word_spam
-        p_ham, p_spam = p_class
-        p_msg_ham_p_ham = p_msg_ham * p_ham
-        p_msg_spam_p_spam = p_msg_spam * p_spam
-        p_msg_tot = p_msg_ham_p_ham + p_msg_spam_p_spam
-        return p_msg_ham_p_ham / p_msg_tot, p_msg_spam_p_spam / p_msg_tot
+            indptr, indices = pp.index_messages(messages, self.word_to_idx)
+            n_messages = len(indptr) - 1
+            rows = np.repeat(np.arange(n_messages), np.diff(indptr))  # Message of each word
+            with np.errstate(invalid="ignore"):  # inf - inf log-odds give nan
+                scores = np.bincount(rows, weights=self.log_odds[indices], minlength=n_messages)
+                scores = scores + self.log_prior_odds
+            if np.isnan(scores).any():
+                raise ValueError(_ZERO_LIKELIHOOD_ERROR)
+            return np.where(scores > 0, "ham", "spam").tolist()
 
     def predict_word_proba(self, message):
-            words = pp.split_words(pp.clean_msg(message))
-
-            res = {}
-            for w in words:
-                if w in self._word_counts:
-                    n_w_ham, n_w_spam = self._word_counts[w]
-
-                    if self.alpha > 0.0:
-                        n_w_ham += self.alpha
-                        n_w_spam += self.alpha
-
-                    n_w_tot = n_w_ham + n_w_spam
-                    p_ham_word = n_w_ham / n_w_tot
-                    p_spam_word = n_w_spam / n_w_tot
-                    res[w] = (p_ham_word, p_spam_word)
-            return res
\ No newline at end of file
+        msg_words = pp.tokenize(message)
+        if len(msg_words) <= len(self.word_to_idx):  # Probe the largest set
+            pairs = [(w, i) for w in msg_words if (i := self.word_to_idx.get(w)) is not None]
+        else:
+            pairs = [(w, i) for i, w in enumerate(self.vocab) if w in msg_words]
+        words = [w for w, _ in pairs]
+        idx = np.fromiter((i for _, i in pairs), dtype=np.int32, count=len(pairs))
+        alpha = self.alpha if self.alpha > 0.0 else 0.0
+        n_w_ham = self.n_ham_arr[idx] + alpha
+        n_w_spam = self.n_spam_arr[idx] + alpha
+        n_w_tot = n_w_ham + n_w_spam
+        p_ham_word = (n_w_ham / n_w_tot).tolist()
+        p_spam_word = (n_w_spam / n_w_tot).tolist()
+        return dict(zip(words, zip(p_ham_word, p_spam_word)))
+
+def estimate_probabilities(word_counts, n_classes, alpha=0.0):
+    """Estimate log p(w|c) and log p(c)
+    Estimate the log of the conditional probability of words knowing the class
+    as well as the log of marginal probabilities based on frequencies.
+    Parameters
+    ----------
+    word_counts: tuple of np.ndarray
+        The number of ham and spam messages containing each word of the vocabulary
+        provided as aligned `(n_w_ham, n_w_spam)` arrays.
+    n_classes: tuple
+        The number of ham and spam messages as a `(n_ham, n_spam)` tuple.
+    alpha: float, optional (default=0.0)
+        The additive smoothing parameter.
+    Returns
+    -------
+    log_p_ham: np.ndarray
+        Log probability of each word knowing the ham class.
+    log_p_spam: np.ndarray
+        Log probability of each word knowing the spam class.
+    log_prior_ham: float
+        Log probability of the ham class.
+    log_prior_spam: float
+        Log probability of the spam class.
+    """
+    n_ham, n_spam = n_classes
+    n_tot = n_ham + n_spam + 2 * alpha
+    if alpha > 0:
+        n_ham += alpha
+        n_spam += alpha
+    n_word_ham, n_word_spam = word_counts
+    with np.errstate(divide="ignore"):  # Unsmoothed zero counts give -inf
+        log_p_ham = np.log((n_word_ham + alpha) / n_ham)
+        log_p_spam = np.log((n_word_spam + alpha) / n_spam)
+    return log_p_ham, log_p_spam, np.log(n_ham / n_tot), np.log(n_spam / n_tot)
+
+
+def classify_message(message, prob_info):
+    """Compute the probability for a message to be ham or spam
+    Parameters
+    ----------
+    message: str
+        The input message.
+    prob_info: tuple
+        A tuple containing probability information computed on the training corpus as
+        stored by `SpamDetector.fit`.
+        It contains:
+        log_p_ham: np.ndarray
+            The log probability of a message to contain a given word knowing it is ham.
+        log_p_spam: np.ndarray
+            The log probability of a message to contain a given word knowing it is spam.
+        word_to_idx: dict
+            The index of each word in the `log_p_ham` and `log_p_spam` arrays.
+        log_prior_ham: float
+            The log probability of the ham class.
+        log_prior_spam: float
+            The log probability of the spam class.
+    Returns
+    -------
+    p_ham: float
+        The probability of the message to belong to the ham class
+    p_spam: float
+        The probability of the message to belong to the spam class.
+    Note
+    ----
+    Scores are summed in log-space to avoid underflow on long messages.
+    Words absent from the training corpus are ignored.
+    A `ValueError` is raised when both classes have a zero probability, which
+    can only happen without smoothing (`alpha=0`).
+    """
+    log_p_ham, log_p_spam, word_to_idx, log_prior_ham, log_prior_spam = prob_info
+    msg_words = pp.tokenize(message)
+    idx = np.array([i for w in msg_words if (i := word_to_idx.get(w)) is not None], dtype=np.int32)
+    s_ham = log_p_ham[idx].sum() + log_prior_ham
+    s_spam = log_p_spam[idx].sum() + log_prior_spam
+    m = max(s_ham, s_spam)
+    if m == -np.inf:
+        raise ValueError(_ZERO_LIKELIHOOD_ERROR)
+    p_ham = np.exp(s_ham - m)
+    p_spam = np.exp(s_spam - m)
+    p_tot = p_ham + p_spam
+    return float(p_ham / p_tot), float(p_spam / p_tot)
+
+
+def classify_messages(messages, prob_info):
+    """Compute the probability for each message of a sequence to be ham or spam
+    All the messages are scored at once through a sparse product between the
+    message/word indicator matrix and the log probabilities of the words.
+    Parameters
+    ----------
+    messages: seq of str
+        The input messages.
+    prob_info: tuple
+        A tuple containing probability information computed on the training corpus as
+        stored by `SpamDetector.fit`.
+    Returns
+    -------
+    proba: list of tuples
+        A `(p_ham, p_spam)` tuple for each input message.
+    """
+    indptr, indices = pp.index_messages(messages, prob_info[2])
+    P = _classify_indexed(indptr, indices, prob_info)
+    return [tuple(p) for p in P.tolist()]
+
+
+def _indicator_matrix(indptr, indices, n_words):
+    """Build the sparse message/word indicator matrix of messages indexed by `index_messages`"""
+    import scipy.sparse as sp  # Deferred, scipy is slow to import
+    data = np.ones(len(indices), dtype=np.float64)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, n_words))
+
+
+def _classify_indexed(indptr, indices, prob_info):
+    """Compute the `(N, 2)` class probabilities of messages indexed by `index_messages`"""
+    log_p_ham, log_p_spam, word_to_idx, log_prior_ham, log_prior_spam = prob_info
+    X = _indicator_matrix(indptr, indices, len(word_to_idx))
+    LP = np.column_stack((log_p_ham, log_p_spam))
+    S = X @ LP + np.array([log_prior_ham, log_prior_spam])
+    S_max = S.max(axis=1, keepdims=True)
+    if np.isneginf(S_max).any():
+        raise ValueError(_ZERO_LIKELIHOOD_ERROR)
+    S -= S_max
+    E = np.exp(S)
+    return E / E.sum(axis=1, keepdims=True)
+
+
+@lru_cache(maxsize=None)
+def _score_kernel():
+    """Return the batch scoring kernel, or None when numba is not installed"""
+    try:  # Deferred, numba is slow to import
+        from ._kernels import score_indexed
+    except ImportError:  # Optional dependency, batch scoring falls back to the sparse product
+        return None
+    return score_indexed
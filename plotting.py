@@ -1,40 +1,65 @@
-import plotly.express as px
+import numpy as np
+
+# Above this number of words, sort them with a NumPy argsort rather than a Python key function
+_ARGSORT_MIN_WORDS = 64
 
 def draw_message_scores(pham, pspam, height=200, width=400):
-    fig = px.bar(
-        [{"Label": "ham", "Prob": pham}, {"Label": "spam", "Prob": pspam}],
-        y="Label",
-        x="Prob",
-        color="Label",
+    import plotly.graph_objects as go  # Deferred, plotly is slow to import
+    fig = go.Figure(
+        go.Bar(
+            y=["ham", "spam"],
+            x=[pham, pspam],
+            orientation="h",
+            marker_color=["seagreen", "tomato"],
+        )
+    )
+    fig.update_layout(
+        showlegend=False,
         height=height,
         width=width,
-        color_discrete_map={"ham": "seagreen", "spam": "tomato"},
+        margin=dict(r=0, l=0, t=0, b=0),
+        xaxis_title="Prob",
+        yaxis_title="Label",
     )
-    fig.update_layout(showlegend=False, margin=dict(r=0, l=0, t=0, b=0))
     fig.update_xaxes(range=(0, 1))
     return fig
 
 def draw_word_scores(words, line_height=50, width=400):
-    if len(words) > 0:
+    import plotly.graph_objects as go  # Deferred, plotly is slow to import
+    if len(words) > _ARGSORT_MIN_WORDS:
+        items = list(words.items())
+        pspams = np.fromiter((pspam for _, (_, pspam) in items), dtype=np.float64, count=len(items))
+        words = [items[i] for i in np.argsort(pspams, kind="stable")]
+    elif len(words) > 0:
         words = sorted(words.items(), key=lambda x: x[1][1])
     else:
         words = [("      ", (0.5, 0.5))]
-    words_data = [
-        {"Word": word, "Label": "ham", "Prob": pham}
-        for word, (pham, _) in words
-    ] + [
-        {"Word": word, "Label": "spam", "Prob": pspam}
-        for word, (_, pspam) in words
-    ]
-    fig = px.bar(
-        words_data,
-        y="Word",
-        x="Prob",
-        color="Label",
+    labels, probs = zip(*words)
+    phams, pspams = zip(*probs)
+    fig = go.Figure([
+        go.Bar(
+            name="ham",
+            y=labels,
+            x=phams,
+            orientation="h",
+            marker_color="seagreen",
+        ),
+        go.Bar(
+            name="spam",
+            y=labels,
+            x=pspams,
+            orientation="h",
+            marker_color="tomato",
+        ),
+    ])
+    fig.update_layout(
+        barmode="relative",
         height=line_height * len(words) if len(words) > 1 else 150,
         width=width,
-        color_discrete_map={"ham": "seagreen", "spam": "tomato"},
+        margin=dict(r=0, l=0, t=0, b=0),
+        xaxis_title="Prob",
+        yaxis_title="Word",
+        legend_title_text="Label",
     )
-    fig.update_layout(margin=dict(r=0, l=0, t=0, b=0))
     fig.update_xaxes(range=(0, 1))
-    return fig
\ No newline at end of file
+    return fig
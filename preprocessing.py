@@ -1,5 +1,14 @@
 from collections import Counter
-import random
+from functools import lru_cache
+from itertools import compress
+import re
+
+import numpy as np
+
+# Translation table replacing every non alphabetical ASCII character with a space
+_ASCII_CLEAN_TABLE = str.maketrans({chr(i): " " for i in range(128) if not chr(i).isalpha()})
+# Words of a lower case ASCII message
+_ASCII_TOKEN_RE = re.compile(r"[a-z]+")
 
 def split_file(filename):
     """ Split the content of a file in lines
@@ -16,7 +25,7 @@ def split_file(filename):
         The none blank lines from the input file.
     """
     with open(filename, "r", encoding="utf8") as in_file:
-        return [line.strip() for line in in_file.readlines() if len(line.strip()) > 0]
+        return [s for s in (line.strip() for line in in_file) if s]
 
 def split_line(line):
     """ Split a message line into annotation and message body.
@@ -73,10 +82,8 @@ def count_ham_and_spam(ann_msg_list):
     n_spam: int
         The number of spam messages in the input list
     """
-    return (
-        len([a for a, _ in ann_msg_list if a == "ham"]),
-        len([a for a, _ in ann_msg_list if a == "spam"])
-    )
+    ann_count = Counter(a for a, _ in ann_msg_list)
+    return ann_count["ham"], ann_count["spam"]
 
 def clean_msg(msg):
     """Clean the content of a message.
@@ -91,6 +98,8 @@ def clean_msg(msg):
     cleaned_msg: str
         The cleaned message
     """
+    if msg.isascii():  # Fast path, a single C level pass over the message
+        return msg.translate(_ASCII_CLEAN_TABLE)
     return "".join([c if c.isalpha() else " " for c in msg])
 
 def split_words(msg):
@@ -108,6 +117,56 @@ def split_words(msg):
     """
     return set([w.lower() for w in msg.split()])
 
+@lru_cache(maxsize=4096)
+def tokenize(msg):
+    """ Clean a message and split it into distinct words.
+    This function is equivalent to `split_words(clean_msg(msg))` but
+    extracts the words of ASCII messages in a single regex pass.
+    Results are cached for the last messages seen.
+    Parameters
+    ----------
+    msg: str
+        The input message.
+    Returns
+    -------
+    words: frozenset of str
+        The set of distinct lower case words in the message.
+    Note
+    ----
+    Training functions call `tokenize.__wrapped__` to keep corpus messages out of the cache.
+    """
+    if msg.isascii():
+        return frozenset(_ASCII_TOKEN_RE.findall(msg.lower()))
+    return frozenset(split_words(clean_msg(msg)))
+
+def index_messages(msg_list, word_to_idx):
+    """ Index the known words of a sequence of messages.
+    This function tokenizes each message and gathers the indices of its words
+    found in the vocabulary as the `indptr`/`indices` arrays of a CSR matrix
+    with one row per message.
+    Parameters
+    ----------
+    msg_list: seq of str
+        The input messages.
+    word_to_idx: dict[str, int]
+        The index of each word of the vocabulary.
+    Returns
+    -------
+    indptr: np.ndarray
+        The indices of `indices` where the words of each message start, of length `len(msg_list) + 1`.
+    indices: np.ndarray
+        The vocabulary indices of the words of all the messages.
+    Note
+    ----
+    Words absent from the vocabulary are ignored.
+    """
+    indptr = [0]
+    indices = []
+    for msg in msg_list:
+        indices.extend([i for w in tokenize(msg) if (i := word_to_idx.get(w)) is not None])
+        indptr.append(len(indices))
+    return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32)
+
 def count_words(msg_list):
     """Count the number of word occurrences in the corpus.
     This function counts, for each word of in the input corpus (i.e.
@@ -127,8 +186,7 @@ def count_words(msg_list):
     """
     word_dict = Counter()
     for msg in msg_list:
-        words = split_words(clean_msg(msg))
-        word_dict += Counter(words)
+        word_dict.update(tokenize.__wrapped__(msg))
     return word_dict
 
 def count_words_in_ham_and_spam(ann_msg_list):
@@ -145,17 +203,15 @@ def count_words_in_ham_and_spam(ann_msg_list):
     ham_spam_count_dict: dict[str, tuple of int]
         The dictionary of counts provided as (word, (n_ham, n_spam)) (key, value) items.
     """
-    ham_messages = [m for a, m in ann_msg_list if a == "ham"]
-    ham_word_count = count_words(ham_messages)
-    spam_messages = [m for a, m in ann_msg_list if a == "spam"]
-    spam_word_count = count_words(spam_messages)
-    all_words = set(ham_word_count.keys()) | set(spam_word_count.keys())
-    ham_spam_word_count = {}
-    for w in all_words:
-        n_ham = ham_word_count.get(w, 0)
-        n_spam = spam_word_count.get(w, 0)
-        ham_spam_word_count[w] = (n_ham, n_spam)
-    return ham_spam_word_count
+    ham_word_count = Counter()
+    spam_word_count = Counter()
+    for ann, msg in ann_msg_list:
+        if ann == "ham":
+            ham_word_count.update(tokenize.__wrapped__(msg))
+        elif ann == "spam":
+            spam_word_count.update(tokenize.__wrapped__(msg))
+    all_words = ham_word_count.keys() | spam_word_count.keys()
+    return {w: (ham_word_count[w], spam_word_count[w]) for w in all_words}
 
 def random_split(seq, p=0.5, seed=None):
     """Randomly split a sequence
@@ -176,13 +232,7 @@ def random_split(seq, p=0.5, seed=None):
     """
     if p < 0 or p > 1:
         raise ValueError("The value of 'p' must be a float between 0 and 1 included.")
-    list1 = []
-    list2 = []
-    if seed is not None:
-        random.seed(seed)
-    for elt in seq:
-        if random.random() < p:
-            list1.append(elt)
-        else:
-            list2.append(elt)
-    return list1, list2
\ No newline at end of file
+    seq = list(seq)
+    rng = np.random.default_rng(seed)
+    mask = rng.random(len(seq)) < p
+    return list(compress(seq, mask)), list(compress(seq, ~mask))
\ No newline at end of file
@@ -1,4 +1,14 @@
-from pickle import dump, load
+from operator import ne
+from pickle import HIGHEST_PROTOCOL, dump, load
+
+import numpy as np
+
+try:
+    import zstandard as zstd
+except ImportError:  # Optional dependency, objects are saved uncompressed
+    zstd = None
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
 
 def save_object(obj, filename):
     """Save an object to a file
@@ -8,9 +18,16 @@ def save_object(obj, filename):
         The object to save.
     filename: str
         The path of the file to save the object in.
+    Note
+    ----
+    The object is compressed with zstd when the `zstandard` package is installed.
     """
     with open(filename, "wb") as out_file:
-        dump(obj, out_file)
+        if zstd is None:
+            dump(obj, out_file, protocol=HIGHEST_PROTOCOL)
+        else:
+            with zstd.ZstdCompressor(level=3).stream_writer(out_file) as z_file:
+                dump(obj, z_file, protocol=HIGHEST_PROTOCOL)
 
 def load_object(filename):
     """Load an object from a file.
@@ -22,9 +39,19 @@ def load_object(filename):
     -------
     obj: object
         The loaded object.
+    Note
+    ----
+    Both zstd compressed and plain pickle files are supported.
     """
     with open(filename, "rb") as in_file:
-        return load(in_file)
+        if in_file.read(4) != _ZSTD_MAGIC:
+            in_file.seek(0)
+            return load(in_file)
+        if zstd is None:
+            raise ImportError("The 'zstandard' package is required to load compressed objects.")
+        in_file.seek(0)
+        with zstd.ZstdDecompressor().stream_reader(in_file) as z_file:
+            return load(z_file)
 
 def misclassification_rate(ytrue, ypred):
     """The rate of samples which are misclassified
@@ -41,4 +68,13 @@ def misclassification_rate(ytrue, ypred):
     """
     if len(ytrue) != len(ypred):
         raise ValueError("ytrue and ypred must have the same length")
-    return sum(1.0 if t != p else 0.0 for t, p in zip(ytrue, ypred)) / len(ytrue)
\ No newline at end of file
+    if len(ytrue) == 0:
+        raise ValueError("ytrue and ypred must not be empty")
+    if (
+        isinstance(ytrue, np.ndarray) and isinstance(ypred, np.ndarray)
+        and ytrue.dtype.kind == ypred.dtype.kind != "O"
+    ):
+        return float((ytrue != ypred).mean())
+    # Other labels are compared element by element with the Python `!=` operator,
+    # converting them to arrays would cost more than the comparison
+    return sum(map(ne, ytrue, ypred)) / len(ytrue)